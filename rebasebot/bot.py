@@ -17,24 +17,38 @@
 
 from typing import Optional, Tuple
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
 import logging
 import builtins
 import os
+import re
 import subprocess
 import sys
-import glob
 
 import git
 import git.compat
 import github3
 import requests
+from requests.adapters import HTTPAdapter
 from git.objects import Commit
 from github3.repos.repo import Repository
 from github3.repos.commit import ShortCommit
 from github3.pulls import ShortPullRequest
 
 from rebasebot.github import GithubAppProvider, GitHubBranch
+from rebasebot.git_utils import (
+    rev_parse,
+    deepen_source_branches,
+    find_merge_base,
+    is_shallow,
+    is_ref_a_tag,
+    fetch_dest,
+    fetch_source,
+    write_commit_graph,
+)
+from rebasebot.merged_prs import MERGED_PRS_CACHE_PATH, load_merged_prs_cache, save_merged_prs_cache, lookup_merged_prs
 
 
 class RepoException(Exception):
@@ -57,39 +71,104 @@ logging.basicConfig(
 
 MERGE_TMP_BRANCH = "merge-tmp"
 
+# Maximum number of attempts to resolve a conflict that fails with a git error,
+# e.g. because of a stale index.lock, before giving up.
+MAX_CONFLICT_RESOLUTION_ATTEMPTS = 5
+
+
+@dataclass
+class _RebaseState:
+    """
+    _RebaseState holds the git state of the source and dest branches,
+    so it can be shared between the rebase steps instead of recomputing it.
+
+    :source_sha:    sha of the source branch head
+    :dest_sha:      sha of the dest branch head
+    :merge_base:    last shared commit of the source and dest branches
+    """
+    source_sha: str
+    dest_sha: str
+    merge_base: str
+
+
+# Session reused for all Slack messages, so the connection is kept alive between them.
+_SLACK_SESSION = requests.Session()
+_SLACK_SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
 
 def _message_slack(webhook_url: str, msg: str) -> None:
     """Send a message to Slack via a webhook if one is configured."""
     if webhook_url is None:
         return
-    requests.post(webhook_url, json={"text": msg}, timeout=5)
+    _SLACK_SESSION.post(webhook_url, json={"text": msg}, timeout=5)
+
+
+def _reset_go_mod_files(gitwd: git.Repo, source: GitHubBranch, module_base_paths: list) -> None:
+    """Checks out go.mod and go.sum of all modules from the source branch in a single git call."""
+    paths = []
+    for module_base_path in module_base_paths:
+        for filename in ["go.mod", "go.sum"]:
+            full_path = os.path.normpath(os.path.join(module_base_path, filename))
+            if os.path.exists(full_path):
+                paths.append(full_path)
+
+    if not paths:
+        return
+
+    try:
+        gitwd.git.checkout(f"source/{source.branch}", "--", *paths)
+        return
+    except git.GitCommandError:
+        # Some of the modules are downstream only, so the checkout of the
+        # whole batch failed. Retry with the files that exist in the source.
+        logging.debug("Some go modules are downstream only, resetting only upstream ones")
+
+    source_files = set(gitwd.git.ls_tree("-r", "--name-only", f"source/{source.branch}").splitlines())
+
+    upstream_paths = []
+    for full_path in paths:
+        # Skip the whole module if its go.mod is not present in the source
+        go_mod_path = os.path.join(os.path.dirname(full_path), "go.mod")
+        if os.path.normpath(go_mod_path) not in source_files:
+            logging.debug("go module at %s is downstream only, skip its resetting", os.path.dirname(full_path))
+            continue
+        if full_path in source_files:
+            upstream_paths.append(full_path)
+
+    if upstream_paths:
+        gitwd.git.checkout(f"source/{source.branch}", "--", *upstream_paths)
+
+
+def _list_go_modules(gitwd: git.Repo) -> list:
+    """Returns the base paths of the go modules tracked in the working directory.
+
+    Like a recursive glob, this skips modules in dot-directories, e.g. tool
+    modules in .bingo, which must not be tidied and vendored.
+    """
+    # List go modules from the git index instead of walking the whole working tree
+    return [
+        os.path.dirname(filepath) or "." for filepath in gitwd.git.ls_files("go.mod", "**/go.mod").splitlines()
+        if not any(part.startswith(".") for part in filepath.split("/"))
+    ]
 
 
 def _commit_go_mod_updates(gitwd: git.Repo, source: GitHubBranch) -> None:
     logging.info("Performing go modules update")
 
-    for filepath in glob.glob('./**/go.mod', recursive=True):
-        module_base_path = os.path.dirname(filepath)
+    module_base_paths = _list_go_modules(gitwd)
 
-        try:
-            # Reset go.mod and go.sum to make sure they are the same as in the source
-            for filename in ["go.mod", "go.sum"]:
-                full_path = os.path.join(module_base_path, filename)
-                if not os.path.exists(full_path):
-                    continue
-                try:
-                    gitwd.remotes.source.repo.git.checkout(f"source/{source.branch}", full_path)
-                except git.GitCommandError:
-                    logging.debug("go module at %s is downstream only, skip its resetting", module_base_path)
-                    break
+    # Reset go.mod and go.sum to make sure they are the same as in the source
+    _reset_go_mod_files(gitwd, source, module_base_paths)
 
+    for module_base_path in module_base_paths:
+        try:
             proc = subprocess.run(
-                "go mod tidy", cwd=module_base_path, shell=True, check=True, capture_output=True
+                ["go", "mod", "tidy"], cwd=module_base_path, check=True, capture_output=True
             )
             logging.debug("go mod tidy output: %s", proc.stdout.decode())
 
             proc = subprocess.run(
-                "go mod vendor", cwd=module_base_path, shell=True, check=True, capture_output=True
+                ["go", "mod", "vendor"], cwd=module_base_path, check=True, capture_output=True
             )
             logging.debug("go mod vendor output %s:", proc.stdout.decode())
 
@@ -112,20 +191,30 @@ def _commit_go_mod_updates(gitwd: git.Repo, source: GitHubBranch) -> None:
             raise err
 
 
-def _needs_rebase(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBranch) -> bool:
-    try:
-        branches_with_commit = gitwd.git.branch("-r", "--contains", f"source/{source.branch}")
-        dest_branch = f"dest/{dest.branch}"
-        logging.info("Branches with commit:\n%s", branches_with_commit)
-        for branch in branches_with_commit.splitlines():
-            # Must strip the branch name as git branch adds an indent
-            if branch.lstrip() == dest_branch:
-                logging.info("Dest branch already contains the latest changes.")
-                return False
-    except git.GitCommandError as ex:
-        # if the source head hasn't been found in the dest repo git returns an error.
-        # In this case we need to ignore it and continue.
-        logging.error(ex)
+def _get_rebase_state(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBranch) -> _RebaseState:
+    source_sha = rev_parse(gitwd, f"source/{source.branch}")
+    dest_sha = rev_parse(gitwd, f"dest/{dest.branch}")
+
+    if source_sha == dest_sha:
+        # Both branches point to the same commit, which is their merge base,
+        # so there is no need to walk the history.
+        return _RebaseState(source_sha, dest_sha, source_sha)
+
+    return _RebaseState(source_sha, dest_sha, find_merge_base(gitwd, source, dest, source_sha, dest_sha))
+
+
+def _needs_rebase(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBranch,
+                  rebase_state: Optional[_RebaseState] = None) -> bool:
+    if rebase_state is None:
+        rebase_state = _get_rebase_state(gitwd, source, dest)
+
+    # The source head is an ancestor of the dest branch exactly when it is
+    # their merge base, so the cached merge base answers the same question
+    # as "git merge-base --is-ancestor" without another git call.
+    if rebase_state.merge_base == rebase_state.source_sha:
+        logging.info("Dest branch already contains the latest changes.")
+        return False
+
     return True
 
 
@@ -135,7 +224,20 @@ def _is_pr_merged(pr_number: int, source_repo: Repository) -> bool:
     return gh_pr.is_merged()
 
 
-def _add_to_rebase(commit_message: str, source_repo: Repository, tag_policy: str) -> bool:
+def _upstream_pr_numbers(downstream_commits: list) -> set:
+    """Returns numbers of upstream pull requests referenced by "UPSTREAM: <N>:" commit tags."""
+    pr_numbers = set()
+    for _, commit_message, _ in downstream_commits:
+        if commit_message.startswith("UPSTREAM: "):
+            commit_tag = commit_message.removeprefix("UPSTREAM: ").split(":", 1)[0]
+            if commit_tag.isnumeric():
+                pr_numbers.add(int(commit_tag))
+
+    return pr_numbers
+
+
+def _add_to_rebase(commit_message: str, source_repo: Repository, tag_policy: str,
+                   merged_prs: Optional[dict] = None) -> bool:
     valid_tag_policy = ["soft", "strict", "none"]
     if tag_policy not in valid_tag_policy:
         raise builtins.Exception(f"Unknown tag policy: {tag_policy}")
@@ -154,7 +256,10 @@ def _add_to_rebase(commit_message: str, source_repo: Repository, tag_policy: str
             return True
 
         if commit_tag.isnumeric():
-            return not _is_pr_merged(int(commit_tag), source_repo)
+            pr_number = int(commit_tag)
+            if merged_prs is not None and pr_number in merged_prs:
+                return not merged_prs[pr_number]
+            return not _is_pr_merged(pr_number, source_repo)
 
         raise builtins.Exception(f"Unknown commit message tag: {commit_tag}")
 
@@ -163,12 +268,16 @@ def _add_to_rebase(commit_message: str, source_repo: Repository, tag_policy: str
     return tag_policy == "soft"
 
 
-def _in_excluded_commits(sha: str, exclude_commits: list) -> bool:
-    for excluded_sha in exclude_commits:
-        if sha.startswith(excluded_sha):
-            return True
+def _compile_excluded_commits(exclude_commits: list) -> Optional[re.Pattern]:
+    """Compiles excluded commit sha prefixes into a single regex, or returns None if there are none."""
+    if not exclude_commits:
+        return None
 
-    return False
+    return re.compile("(?:" + "|".join(re.escape(sha) for sha in exclude_commits) + ")")
+
+
+def _in_excluded_commits(sha: str, excluded_commits_re: Optional[re.Pattern]) -> bool:
+    return excluded_commits_re is not None and excluded_commits_re.match(sha) is not None
 
 
 def _find_last_rebase_merge_commit(gitwd: git.Repo, source_repo: Repository, ancestry_path_merges) -> Commit:
@@ -196,9 +305,9 @@ def _find_last_rebase_merge_commit(gitwd: git.Repo, source_repo: Repository, anc
 
 
 def _identify_downstream_commits(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBranch,
-                                 source_repo: Repository) -> str:
+                                 source_repo: Repository, rebase_state: _RebaseState) -> list:
     # Merge base is the last shared commit of source branch and destination branch
-    merge_base = gitwd.git.merge_base(f"source/{source.branch}", f"dest/{dest.branch}")
+    merge_base = rebase_state.merge_base
     logging.info(f"Merge base of source/{source.branch} and dest/{dest.branch}: %s", merge_base)
 
     # ancestry_path_merges are merge commits on ancestry path from merge base to destination branch
@@ -208,6 +317,10 @@ def _identify_downstream_commits(gitwd: git.Repo, source: GitHubBranch, dest: Gi
     val = '\n'.join(ancestry_path_merges)
     logging.info(f"""Merges on ancestry-path from merge_base=({merge_base}) to dest/{dest.branch} branch:\n{val}""")
 
+    if ancestry_path_merges and is_shallow(gitwd):
+        # "git branch --contains" only sees the fetched history of the source branches
+        deepen_source_branches(gitwd, merge_base, [line.split(" || ", 1)[0] for line in ancestry_path_merges])
+
     last_rebase_merge_commit = _find_last_rebase_merge_commit(gitwd, source_repo, ancestry_path_merges)
     cutoff_commits = []
 
@@ -229,31 +342,48 @@ def _identify_downstream_commits(gitwd: git.Repo, source: GitHubBranch, dest: Gi
     logging.info("Cutoff commits: %s", cutoff_commits)
     # List all commits on dest/branch and stop at cutoff commits
     # This should be the list of commits we are carrying on top of the UPSTREAM
-    downstream_commits = gitwd.git.log("--reverse", "--pretty=format:%H || %s || %aE", "--no-merges",
-                                       "--author-date-order", *cutoff_commits, f"dest/{dest.branch}")
+    downstream_log = gitwd.git.log("--reverse", "--pretty=format:%H || %s || %aE", "--no-merges",
+                                   "--author-date-order", *cutoff_commits, f"dest/{dest.branch}")
+
+    logging.info("Identified downstream commits:\n%s", downstream_log)
+    # Each line is "<sha> || <commit message> || <committer email>". They are
+    # parsed once, as _do_rebase reads the commits twice.
+    downstream_commits = [tuple(commit_line.split(" || ", 2)) for commit_line in downstream_log.splitlines()]
 
-    logging.info("Identified downstream commits:\n%s", downstream_commits)
     return downstream_commits
 
 
 def _do_rebase(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBranch, source_repo: Repository, tag_policy: str,
-               bot_emails: list, exclude_commits: list, update_go_modules: bool) -> None:
+               bot_emails: list, exclude_commits: list, update_go_modules: bool,
+               rebase_state: Optional[_RebaseState] = None, merged_prs_cache: Optional[dict] = None) -> None:
     logging.info("Performing rebase")
 
-    allow_bot_squash = len(bot_emails) > 0
+    if rebase_state is None:
+        rebase_state = _get_rebase_state(gitwd, source, dest)
+
+    bot_email_set = frozenset(bot_emails)
+    allow_bot_squash = len(bot_email_set) > 0
     if allow_bot_squash:
         logging.info("Bot squashing is enabled.")
 
-    downstream_commits = _identify_downstream_commits(gitwd, source, dest, source_repo)
+    downstream_commits = _identify_downstream_commits(gitwd, source, dest, source_repo, rebase_state)
 
-    commits_to_squash = defaultdict(list)
+    # Look up the merged status of all referenced upstream PRs at once
+    # instead of querying GitHub for every commit separately.
+    merged_prs: dict = {}
+    if tag_policy != "none":
+        pr_numbers = _upstream_pr_numbers(downstream_commits)
+        if pr_numbers:
+            merged_prs = lookup_merged_prs(
+                pr_numbers, source_repo, merged_prs_cache if merged_prs_cache is not None else {}
+            )
 
-    for commit_line in downstream_commits.splitlines():
-        # Commit contains the message for logging purposes,
-        # trim on the first space to get just the commit sha
-        sha, commit_message, committer_email = commit_line.split(" || ", 2)
+    excluded_commits_re = _compile_excluded_commits(exclude_commits)
 
-        if _in_excluded_commits(sha, exclude_commits):
+    commits_to_squash = defaultdict(list)
+
+    for sha, commit_message, committer_email in downstream_commits:
+        if _in_excluded_commits(sha, excluded_commits_re):
             logging.info("Explicitly dropping commit from rebase: %s", sha)
             continue
 
@@ -265,7 +395,7 @@ def _do_rebase(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBranch, source
                 logging.info("Dropping Go modules commit %s - %s", sha, commit_message)
                 continue
 
-        if not _add_to_rebase(commit_message, source_repo, tag_policy):
+        if not _add_to_rebase(commit_message, source_repo, tag_policy, merged_prs):
             logging.info("Dropping commit: %s - %s", sha, commit_message)
             continue
 
@@ -273,8 +403,8 @@ def _do_rebase(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBranch, source
             # There is sometimes a prefix with number and a following + sign
             # We have to get rid of that part to make sure to get
             # only the email of the bot.
-            email = committer_email.split("+")[-1]
-            if email in bot_emails:
+            email = committer_email.rpartition("+")[2]
+            if email in bot_email_set:
                 commits_to_squash[email].append({"sha": sha, "commit_message": commit_message})
                 continue
 
@@ -286,18 +416,22 @@ def _do_rebase(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBranch, source
             if not _resolve_rebase_conflicts(gitwd):
                 raise RepoException(f"Git rebase failed: {ex}") from ex
 
-    # Here we cherry-pick the bot's commits and then squash them together
+    # Here we apply the bot's commits to the index without committing them,
+    # so they are squashed together in a single commit.
     # We also want the newest bot commit message to represent the squashed commits
     if allow_bot_squash:
         for key, value in commits_to_squash.items():
             logging.info("Squashing commits for bot: %s: %s", key, value)
             for commit in value:
                 try:
-                    gitwd.git.cherry_pick(commit["sha"], "-Xtheirs")
+                    gitwd.git.cherry_pick(commit["sha"], "-Xtheirs", no_commit=True)
                 except git.GitCommandError as ex:
-                    if not _resolve_rebase_conflicts(gitwd):
+                    if not _resolve_rebase_conflicts(gitwd, commit=False):
                         raise RepoException(f"Git rebase failed: {ex}") from ex
-            gitwd.git.reset("--soft", f"HEAD~{len(value)}")
+
+            if not gitwd.is_dirty(index=True, working_tree=False):
+                logging.info("Commits for bot %s have no changes, skipping them", key)
+                continue
 
             newest_bot_commit_message = value[-1]["commit_message"]
 
@@ -308,11 +442,8 @@ def _prepare_rebase_branch(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBr
     logging.info("Preparing rebase branch")
 
     # Remove an old merge-tmp branch if it exists
-    try:
-        gitwd.git.branch("-d", MERGE_TMP_BRANCH, force=True)
-    except git.GitCommandError:
-        # If the branch doesn't exist, git returns an error.
-        pass
+    if MERGE_TMP_BRANCH in gitwd.heads:
+        gitwd.delete_head(MERGE_TMP_BRANCH, force=True)
 
     # Create a merge tmp branch that matches the source branch head.
     gitwd.git.checkout("-b", MERGE_TMP_BRANCH, f"source/{source.branch}")
@@ -327,21 +458,20 @@ def _prepare_rebase_branch(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBr
     logging.info(f"Merging upstream/{source.branch} into {dest.branch}")
 
     # Remove an old rebase branch if it exists
-    try:
-        gitwd.git.branch("-d", "rebase", force=True)
-    except git.GitCommandError:
-        # If the branch doesn't exist, git returns an error.
-        pass
+    if "rebase" in gitwd.heads:
+        gitwd.delete_head("rebase", force=True)
 
     gitwd.git.checkout("-b", "rebase", commit)
 
 
-def _resolve_conflict(gitwd: git.Repo) -> bool:
-    status = gitwd.git.status(porcelain=True)
+def _resolve_conflict(gitwd: git.Repo, commit: bool = True) -> bool:
+    # With -z, paths are not quoted or escaped and entries are NUL separated
+    status = gitwd.git.status(porcelain=True, z=True)
 
     if not status:
         # No status means the pick was empty, so skip it
-        gitwd.git.cherry_pick("--skip")
+        if commit:
+            gitwd.git.cherry_pick("--skip")
         return True
 
     # Conflict prefixes in porcelain mode that we can fix.
@@ -357,43 +487,54 @@ def _resolve_conflict(gitwd: git.Repo) -> bool:
     allowed_status_prefixes = ["M  ", "D  ", "A  "]
 
     ud_files = []
-    for line in status.splitlines():
-        logging.info("Resolving conflict: %s", line)
-        file_status = line[:3]
+    entries = iter(status.split("\0"))
+    for entry in entries:
+        if not entry:
+            continue
+        file_status = entry[:3]
+        if set(file_status[:2]) & {"R", "C"}:
+            # Renames and copies are followed by an extra entry with the original path
+            next(entries, None)
+        if not commit and "U" not in file_status[:2] and file_status[:2] not in ("AA", "DD"):
+            # Without committing, the index also holds the changes staged by
+            # the previous picks, so only unmerged paths are part of the conflict.
+            continue
+        logging.info("Resolving conflict: %s", entry)
         if file_status in allowed_status_prefixes:
             # There is a conflict we can't resolve
             continue
         if file_status not in allowed_conflict_prefixes:
             # There is a conflict we can't resolve
             return False
-        filename = line[3:].rstrip('\n')
-        # Special characters are escaped
-        if filename[0] == filename[-1] == '"':
-            filename = filename[1:-1]
-            filename = filename.encode('ascii').\
-                decode('unicode_escape').\
-                encode('latin1').\
-                decode(git.compat.defenc)
-        ud_files.append(filename)
+        ud_files.append(entry[3:])
 
-    for ud_file in ud_files:
-        gitwd.git.rm(ud_file)
+    if ud_files:
+        gitwd.git.rm("--", *ud_files)
 
-    gitwd.git.commit("--no-edit")
+    if commit:
+        gitwd.git.commit("--no-edit")
 
     return True
 
 
-def _resolve_rebase_conflicts(gitwd: git.Repo) -> bool:
-    try:
-        if not _resolve_conflict(gitwd):
-            return False
+def _resolve_rebase_conflicts(gitwd: git.Repo, commit: bool = True) -> bool:
+    # Resolving a conflict may fail with another git error, so retry a few
+    # times until it succeeds or hits a conflict we can't resolve.
+    for attempt in range(1, MAX_CONFLICT_RESOLUTION_ATTEMPTS + 1):
+        try:
+            if not _resolve_conflict(gitwd, commit):
+                return False
 
-        logging.info("Conflict has been resolved. Continue rebase.")
+            logging.info("Conflict has been resolved. Continue rebase.")
 
-        return True
-    except git.GitCommandError:
-        return _resolve_rebase_conflicts(gitwd)
+            return True
+        except git.GitCommandError as ex:
+            if attempt == MAX_CONFLICT_RESOLUTION_ATTEMPTS:
+                raise
+            logging.warning("Failed to resolve conflict (attempt %d of %d): %s",
+                            attempt, MAX_CONFLICT_RESOLUTION_ATTEMPTS, ex)
+
+    return False
 
 
 def _cherrypick_art_pull_request(gitwd: git.Repo, dest_repo: Repository, dest: GitHubBranch) -> None:
@@ -488,15 +629,6 @@ def _create_pr(
     return gh_pr.json()["html_url"]
 
 
-def is_ref_a_tag(gitwd: git.Repo, ref: str) -> bool:
-    """Returns True if a git ref is a tag. False otherwise."""
-    try:
-        gitwd.git.show_ref("--tags", ref)
-        return True
-    except git.GitCommandError:
-        return False
-
-
 def _init_working_dir(
     source: GitHubBranch,
     dest: GitHubBranch,
@@ -504,7 +636,9 @@ def _init_working_dir(
     github_app_provider: GithubAppProvider,
     git_username: str,
     git_email: str,
-    workdir: str = "."
+    workdir: str = ".",
+    fetch_all_tags: bool = False,
+    fetch_depth: int = 0
 ) -> git.Repo:
     gitwd = git.Repo.init(path=workdir)
 
@@ -538,17 +672,26 @@ def _init_working_dir(
                 config.set_value("user", "name", git_username)
             config.set_value("merge", "renameLimit", 999999)
 
-    logging.info("Fetching %s from dest", dest.branch)
-    gitwd.remotes.dest.fetch(dest.branch)
-
-    logging.info("Fetching %s from source", source.branch)
-    gitwd.remotes.source.fetch(source.branch)
-
-    logging.info("Fetching all tags from source")
-    gitwd.remotes.source.fetch(refspec='refs/tags/*:refs/tags/*', filter="blob:none")
-
-    logging.info("Fetching all branches from source")
-    gitwd.remotes.source.fetch(refspec='refs/heads/*:refs/heads/*', update_head_ok=True, filter="blob:none")
+        # Speed up history walks (merge-base, log, branch --contains)
+        # with a commit-graph file, and operations on large working trees.
+        config.set_value("core", "commitGraph", "true")
+        config.set_value("gc", "writeCommitGraph", "true")
+        config.set_value("feature", "manyFiles", "true")
+
+    # Limiting the fetch depth only pays off in a new working directory: later
+    # runs only fetch new commits anyway, while a depth would hide history
+    # that is already there. Missing history is deepened to find the merge base.
+    depth = fetch_depth if not gitwd.refs else 0
+
+    # Fetches from different remotes are independent, so they run concurrently.
+    # Fetches into a shallow repository lock its shallow file and can't overlap.
+    with ThreadPoolExecutor(max_workers=1 if depth > 0 or is_shallow(gitwd) else 2) as executor:
+        futures = [
+            executor.submit(fetch_dest, gitwd, dest, depth),
+            executor.submit(fetch_source, gitwd, source, fetch_all_tags, depth),
+        ]
+        for future in futures:
+            future.result()
 
     if is_ref_a_tag(gitwd, source.branch):
         logging.info(f"{source.branch} is a tag, but we must work with branches, creating a branch")
@@ -568,9 +711,11 @@ def _init_working_dir(
         logging.info("Fetching existing rebase branch")
         gitwd.remotes.rebase.fetch(rebase.branch)
 
+    write_commit_graph(gitwd)
+
     # Reset the existing rebase branch to match the source branch
     # or create a new rebase branch based on the source branch.
-    head_commit = gitwd.git.rev_parse(source_ref)
+    head_commit = rev_parse(gitwd, source_ref)
     if "rebase" in gitwd.heads:
         gitwd.heads.rebase.set_commit(head_commit)
     else:
@@ -581,8 +726,23 @@ def _init_working_dir(
     return gitwd
 
 
-def _manual_rebase_pr_in_repo(repo: Repository) -> Optional[ShortPullRequest]:
+def _manual_rebase_pr_in_repo(gh_app: github3.GitHub, repo: Repository) -> Optional[ShortPullRequest]:
     """Checks for the presence of a rebase/manual label on the pull request."""
+    # Search API finds a labeled pull request in a single request
+    # instead of listing all open pull requests of the repository.
+    try:
+        hit = next(iter(gh_app.search_issues(
+            f'repo:{repo.full_name} is:pr is:open label:"rebase/manual"', number=1
+        )), None)
+        if hit is None:
+            return None
+        return repo.pull_request(hit.issue.number)
+    except github3.exceptions.ResponseError as ex:
+        # Search API has a lower rate limit, list pull requests in this case
+        if ex.code not in (403, 429):
+            raise
+        logging.warning("Unable to search for pull requests with 'rebase/manual' label: %s", ex)
+
     prs = repo.pull_requests()
     for pull_req in prs:
         for label in pull_req.labels:
@@ -672,7 +832,9 @@ def run(
     exclude_commits: list,
     update_go_modules: bool = False,
     dry_run: bool = False,
-    ignore_manual_label: bool = False
+    ignore_manual_label: bool = False,
+    fetch_all_tags: bool = False,
+    fetch_depth: int = 0
 ) -> bool:
     """Run Rebase Bot."""
     gh_app = github_app_provider.github_app
@@ -687,7 +849,7 @@ def run(
         logging.info("source repository is %s", source_repo.clone_url)
 
         if not ignore_manual_label:
-            pull_req = _manual_rebase_pr_in_repo(dest_repo)
+            pull_req = _manual_rebase_pr_in_repo(gh_app, dest_repo)
             if pull_req is not None:
                 logging.info(
                     f"Repo {dest_repo.clone_url} has PR {pull_req.html_url} with 'rebase/manual' label, aborting"
@@ -719,7 +881,9 @@ def run(
             rebase,
             github_app_provider,
             git_username,
-            git_email
+            git_email,
+            fetch_all_tags=fetch_all_tags,
+            fetch_depth=fetch_depth
         )
     except Exception as ex:
         logging.exception(f"error initializing the git directory: {ex}", extra={"working_dir": working_dir})
@@ -729,12 +893,16 @@ def run(
         )
         return False
 
+    merged_prs_cache = load_merged_prs_cache(MERGED_PRS_CACHE_PATH)
+    merged_prs_cache_size = len(merged_prs_cache)
+
     try:
-        needs_rebase = _needs_rebase(gitwd, source, dest)
+        rebase_state = _get_rebase_state(gitwd, source, dest)
+        needs_rebase = _needs_rebase(gitwd, source, dest, rebase_state)
         if needs_rebase:
             _prepare_rebase_branch(gitwd, source, dest)
             _do_rebase(gitwd, source, dest, source_repo, tag_policy,
-                       bot_emails, exclude_commits, update_go_modules)
+                       bot_emails, exclude_commits, update_go_modules, rebase_state, merged_prs_cache)
             _cherrypick_art_pull_request(gitwd, dest_repo, dest)
 
             if update_go_modules:
@@ -763,6 +931,9 @@ def run(
             f"{ex}",
         )
         return False
+    finally:
+        if len(merged_prs_cache) != merged_prs_cache_size:
+            save_merged_prs_cache(MERGED_PRS_CACHE_PATH, merged_prs_cache)
 
     if dry_run:
         logging.info("Dry run mode is enabled. Do not create a PR.")
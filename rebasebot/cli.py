@@ -205,6 +205,24 @@ def _parse_cli_arguments():
         required=False,
         help="When enabled, the bot will not check for presence of rebase/manual label on pull requests",
     )
+    parser.add_argument(
+        "--fetch-all-tags",
+        action="store_true",
+        default=False,
+        required=False,
+        help="When enabled, the bot will fetch all tags from the source repo "
+             "instead of only the source tag, if any.",
+    )
+    parser.add_argument(
+        "--fetch-depth",
+        type=int,
+        default=0,
+        required=False,
+        help="Limit fetching of the dest branch and all source branches to the specified "
+             "number of commits when initializing a new working directory. "
+             "The history is deepened if the merge base is not found. "
+             "0 means fetching the full history.",
+    )
 
     return parser.parse_args()
 
@@ -276,7 +294,9 @@ def main():
         exclude_commits=args.exclude_commits,
         update_go_modules=args.update_go_modules,
         dry_run=args.dry_run,
-        ignore_manual_label=args.ignore_manual_label
+        ignore_manual_label=args.ignore_manual_label,
+        fetch_all_tags=args.fetch_all_tags,
+        fetch_depth=args.fetch_depth
     )
 
     if success:
@@ -0,0 +1,166 @@
+#    Copyright 2026 Red Hat, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Contains git helpers to resolve refs and fetch the bot remotes."""
+
+import logging
+
+import git
+import git.compat
+
+from rebasebot.github import GitHubBranch
+
+
+def rev_parse(gitwd: git.Repo, ref: str) -> str:
+    """Returns the sha of the commit a ref points to.
+
+    Unlike "git rev-parse", this doesn't spawn a new git process on every call,
+    but uses the persistent "git cat-file --batch-check" process of GitPython.
+    """
+    return git.compat.safe_decode(gitwd.git.get_object_header(f"{ref}^{{commit}}")[0])
+
+
+# Number of commits a shallow history is first deepened by when the merge base
+# is not in it. It doubles on every further attempt.
+DEEPEN_COMMITS = 100
+
+# Maximum number of attempts to deepen a shallow history before fetching the full one.
+MAX_DEEPEN_ATTEMPTS = 4
+
+
+# Local branches mirroring all source branches
+SOURCE_BRANCHES_REFSPEC = "refs/heads/*:refs/heads/*"
+
+# Commit dates don't always grow along the history, so the source branches are
+# deepened a week further back than the oldest commit they must contain.
+SHALLOW_SINCE_MARGIN = 7 * 24 * 60 * 60
+
+
+def is_shallow(gitwd: git.Repo) -> bool:
+    """Returns True if the working directory has a shallow history."""
+    return gitwd.git.rev_parse("--is-shallow-repository") == "true"
+
+
+def unshallow(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBranch) -> None:
+    """Fetches the full history of the dest and source branches."""
+    for remote, branch in [("dest", dest.branch), ("source", source.branch)]:
+        # Unshallowing one remote may already have completed the repository
+        if is_shallow(gitwd):
+            logging.info("Fetching full history of %s from %s", branch, remote)
+            gitwd.remotes[remote].fetch(branch, unshallow=True)
+
+
+def deepen(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBranch, commits: int) -> None:
+    """Fetches `commits` more commits of the dest and source branches history."""
+    for remote, branch in [("dest", dest.branch), ("source", source.branch)]:
+        # Deepening one remote may already have completed the repository
+        if is_shallow(gitwd):
+            logging.info("Deepening history of %s from %s by %d commits", branch, remote, commits)
+            gitwd.remotes[remote].fetch(branch, deepen=commits)
+
+
+def find_merge_base(gitwd: git.Repo, source: GitHubBranch, dest: GitHubBranch, source_sha: str, dest_sha: str) -> str:
+    """Returns the merge base of the source and dest heads.
+
+    In a shallow repository, the history of both branches is deepened until
+    the merge base is found. The full history is fetched as a last resort.
+    """
+    commits = DEEPEN_COMMITS
+    for attempt in range(MAX_DEEPEN_ATTEMPTS + 1):
+        try:
+            return gitwd.git.merge_base(source_sha, dest_sha)
+        except git.GitCommandError:
+            if not is_shallow(gitwd):
+                raise
+
+        # The merge base is older than the fetched history
+        if attempt < MAX_DEEPEN_ATTEMPTS:
+            logging.info("Merge base is not in the shallow history, deepening it")
+            deepen(gitwd, source, dest, commits)
+            commits *= 2
+        else:
+            logging.info("Merge base is still not in the shallow history, fetching the full history")
+            unshallow(gitwd, source, dest)
+
+    return gitwd.git.merge_base(source_sha, dest_sha)
+
+
+def is_ref_a_tag(gitwd: git.Repo, ref: str) -> bool:
+    """Returns True if a git ref is a tag. False otherwise."""
+    try:
+        gitwd.git.show_ref("--tags", ref)
+        return True
+    except git.GitCommandError:
+        return False
+
+
+def fetch_dest(gitwd: git.Repo, dest: GitHubBranch, depth: int = 0) -> None:
+    """Fetches the dest branch, limited to `depth` commits if set."""
+    logging.info("Fetching %s from dest", dest.branch)
+    # GitPython omits options set to None, so depth 0 fetches the full history
+    gitwd.remotes.dest.fetch(dest.branch, depth=depth or None)
+
+
+def fetch_source(gitwd: git.Repo, source: GitHubBranch, fetch_all_tags: bool = False, depth: int = 0) -> None:
+    """Fetches the source branch, source tags and all source branches into local
+    branches. The branches are limited to `depth` commits if set.
+    """
+    # Every fetch from source also updates the source remote-tracking refs,
+    # so these must run one after another to avoid ref lock contention.
+    logging.info("Fetching %s from source", source.branch)
+    gitwd.remotes.source.fetch(source.branch, depth=depth or None)
+
+    if fetch_all_tags:
+        logging.info("Fetching all tags from source")
+        gitwd.remotes.source.fetch(refspec='refs/tags/*:refs/tags/*', filter="blob:none")
+    elif source.branch not in gitwd.remotes.source.refs and not is_ref_a_tag(gitwd, source.branch):
+        # The fetched ref didn't create a remote-tracking branch, so it must
+        # be a tag. Fetch only this tag instead of all of them.
+        logging.info("Fetching tag %s from source", source.branch)
+        gitwd.remotes.source.fetch(refspec=f"refs/tags/{source.branch}:refs/tags/{source.branch}")
+
+    logging.info("Fetching all branches from source")
+    gitwd.remotes.source.fetch(refspec=SOURCE_BRANCHES_REFSPEC, update_head_ok=True, filter="blob:none",
+                               depth=depth or None)
+
+
+def deepen_source_branches(gitwd: git.Repo, merge_base: str, merges: list) -> None:
+    """Deepens the history of the local source branches back to the merge base
+    and the parents of `merges`, so "git branch --contains" sees these parents.
+    """
+    commits = [merge_base] + [parent.hexsha for sha in merges for parent in gitwd.commit(sha).parents]
+    try:
+        oldest = min(int(date) for date in gitwd.git.log("--no-walk", "--format=%ct", *commits).split())
+    except git.GitCommandError:
+        # Some of the parents are not in the fetched history, so their date is unknown
+        logging.info("Fetching full history of all branches from source")
+        gitwd.remotes.source.fetch(refspec=SOURCE_BRANCHES_REFSPEC, update_head_ok=True, filter="blob:none",
+                                   unshallow=True)
+        return
+
+    since = oldest - SHALLOW_SINCE_MARGIN
+    logging.info("Deepening history of all branches from source since %s", since)
+    gitwd.remotes.source.fetch(refspec=SOURCE_BRANCHES_REFSPEC, update_head_ok=True, filter="blob:none",
+                               shallow_since=f"@{since}")
+
+
+def write_commit_graph(gitwd: git.Repo) -> None:
+    """Writes the commit-graph for all fetched commits. Failures are only logged,
+    since git falls back to reading the commits directly.
+    """
+    logging.info("Writing commit-graph")
+    try:
+        # --split only writes the commits that are not in the graph yet
+        gitwd.git.commit_graph("write", "--reachable", "--changed-paths", "--split")
+    except git.GitCommandError as ex:
+        logging.warning("Unable to write commit-graph: %s", ex)
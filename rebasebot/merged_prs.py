@@ -0,0 +1,116 @@
+#    Copyright 2026 Red Hat, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Contains helpers to look up and cache merged upstream pull requests."""
+
+import logging
+import json
+import os
+
+import requests
+from github3.repos.repo import Repository
+
+
+# Maximum number of pull requests to query in a single GraphQL request.
+GRAPHQL_PR_BATCH_SIZE = 100
+
+
+# File caching upstream pull requests that are known to be merged, so they
+# are not checked again on every run. A merged PR never becomes unmerged.
+MERGED_PRS_CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "rebasebot", "merged_prs.json"
+)
+
+
+def get_merged_prs(pr_numbers: set, source_repo: Repository) -> dict:
+    """Fetches the merged status of multiple pull requests with batched GraphQL queries.
+
+    Returns a dict mapping pull request numbers to their merged status.
+    Pull requests that GitHub couldn't resolve are absent from the result.
+    """
+    merged_prs: dict = {}
+    sorted_pr_numbers = sorted(pr_numbers)
+
+    for i in range(0, len(sorted_pr_numbers), GRAPHQL_PR_BATCH_SIZE):
+        batch = sorted_pr_numbers[i:i + GRAPHQL_PR_BATCH_SIZE]
+        logging.info("Checking that PRs %s have been merged", batch)
+
+        pr_queries = " ".join(f"pr{n}: pullRequest(number: {n}) {{ merged }}" for n in batch)
+        query = (
+            f'query {{ repository(owner: "{source_repo.owner.login}", name: "{source_repo.name}") '
+            f'{{ {pr_queries} }} }}'
+        )
+
+        response: requests.Response = source_repo._post(  # pylint: disable=W0212
+            "https://api.github.com/graphql",
+            data={"query": query},
+            json=True,
+        )
+        response.raise_for_status()
+
+        repository = (response.json().get("data") or {}).get("repository") or {}
+        for n in batch:
+            pull_request = repository.get(f"pr{n}")
+            if pull_request is not None:
+                merged_prs[n] = pull_request["merged"]
+
+    return merged_prs
+
+
+def load_merged_prs_cache(path: str) -> dict:
+    """Loads the cache of merged upstream pull requests, or returns an empty one."""
+    try:
+        with open(path, "r", encoding="utf-8") as cache_file:
+            cache = json.load(cache_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as ex:
+        logging.warning("Unable to load merged PRs cache from %s: %s", path, ex)
+        return {}
+
+    if not isinstance(cache, dict):
+        logging.warning("Ignoring malformed merged PRs cache %s", path)
+        return {}
+
+    return cache
+
+
+def save_merged_prs_cache(path: str, cache: dict) -> None:
+    """Writes the cache of merged upstream pull requests. Failures are only logged."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(tmp_path, path)
+    except OSError as ex:
+        logging.warning("Unable to save merged PRs cache to %s: %s", path, ex)
+
+
+def lookup_merged_prs(pr_numbers: set, source_repo: Repository, merged_prs_cache: dict) -> dict:
+    """Returns the merged status of pull requests, querying GitHub only for
+    those not already cached as merged. Newly merged ones are added to the cache.
+    """
+    merged_prs = {
+        n: True for n in pr_numbers if merged_prs_cache.get(f"{source_repo.full_name}#{n}")
+    }
+
+    not_cached = pr_numbers - merged_prs.keys()
+    if not_cached:
+        merged_prs.update(get_merged_prs(not_cached, source_repo))
+
+    for n, merged in merged_prs.items():
+        if merged:
+            merged_prs_cache[f"{source_repo.full_name}#{n}"] = True
+
+    return merged_prs
@@ -14,12 +14,22 @@
 import os
 from unittest.mock import MagicMock, patch
 
+import git
 import pytest
 
 from rebasebot.github import GitHubBranch
 from rebasebot.bot import (
+    MAX_CONFLICT_RESOLUTION_ATTEMPTS,
     _commit_go_mod_updates,
+    _compile_excluded_commits,
+    _list_go_modules,
+    _reset_go_mod_files,
+    _resolve_rebase_conflicts,
     _add_to_rebase,
+    _get_rebase_state,
+    _in_excluded_commits,
+    _message_slack,
+    _needs_rebase,
     _is_pr_available,
     _report_result,
     _update_pr_title
@@ -72,6 +82,45 @@ class TestGoMod:
         assert len(commits) == 2  # first commit came from the fixture
         assert commits[0].message == "tidy and vendor go stuff\n"
 
+    def test_reset_go_mod_files_downstream_only_module(self, tmp_go_app_repo):
+        repo_dir, repo = tmp_go_app_repo
+
+        os.chdir(repo_dir)
+        with open("go.mod", "w", encoding="utf8") as file:
+            file.write("module example.com/foo\n")
+        repo.git.add(all=True)
+        repo.git.commit("-m", "Init go module")
+
+        source = GitHubBranch(repo_dir, "example", "foo",
+                              repo.active_branch.name)
+        repo.create_remote("source", source.url)
+        repo.remotes.source.fetch(source.branch)
+
+        os.mkdir("downstream")
+        with open(os.path.join("downstream", "go.mod"), "w", encoding="utf8") as file:
+            file.write("module example.com/downstream\n")
+        with open("go.mod", "w", encoding="utf8") as file:
+            file.write("module example.com/changed\n")
+
+        _reset_go_mod_files(repo, source, [".", "./downstream"])
+
+        with open("go.mod", encoding="utf8") as file:
+            assert file.read() == "module example.com/foo\n"
+        with open(os.path.join("downstream", "go.mod"), encoding="utf8") as file:
+            assert file.read() == "module example.com/downstream\n"
+
+    def test_list_go_modules_skips_dot_directories(self, tmp_go_app_repo):
+        repo_dir, repo = tmp_go_app_repo
+
+        for module_dir in [".", os.path.join("a", "b"), ".bingo", os.path.join("a", ".tools")]:
+            os.makedirs(os.path.join(repo_dir, module_dir), exist_ok=True)
+            with open(os.path.join(repo_dir, module_dir, "go.mod"), "w", encoding="utf8") as file:
+                file.write("module example.com/foo\n")
+        repo.git.add(all=True)
+        repo.git.commit("-m", "Add go modules")
+
+        assert sorted(_list_go_modules(repo)) == [".", "a/b"]
+
 
 class TestCommitMessageTags:
 
@@ -121,6 +170,79 @@ class TestCommitMessageTags:
         else:
             assert _add_to_rebase(commit_message, None, tag_policy) == expected
 
+    @patch('rebasebot.bot._is_pr_merged')
+    def test_commit_messages_tags_merged_prs(self, mocked_is_pr_merged):
+        merged_prs = {100: True, 101: False}
+
+        assert not _add_to_rebase("UPSTREAM: 100: something", None, "soft", merged_prs)
+        assert _add_to_rebase("UPSTREAM: 101: something", None, "soft", merged_prs)
+        mocked_is_pr_merged.assert_not_called()
+
+        # PRs missing from the batched result are checked one by one
+        mocked_is_pr_merged.return_value = True
+        assert not _add_to_rebase("UPSTREAM: 102: something", None, "soft", merged_prs)
+        mocked_is_pr_merged.assert_called_once_with(102, None)
+
+
+class TestExcludedCommits:
+
+    @pytest.mark.parametrize(
+        'sha,exclude_commits,expected',
+        (
+            ("abcdef123", ["abcdef123"], True),
+            # Short sha prefixes are matched
+            ("abcdef123", ["fff", "abc"], True),
+            ("abcdef123", ["bcd"], False),
+            ("abcdef123", [], False),
+        )
+    )
+    def test_in_excluded_commits(self, sha, exclude_commits, expected):
+        assert _in_excluded_commits(sha, _compile_excluded_commits(exclude_commits)) == expected
+
+
+class TestResolveRebaseConflicts:
+
+    def test_retries_are_bounded(self):
+        gitwd = MagicMock()
+        gitwd.git.status.side_effect = git.GitCommandError("status", 128)
+
+        with pytest.raises(git.GitCommandError):
+            _resolve_rebase_conflicts(gitwd)
+
+        assert gitwd.git.status.call_count == MAX_CONFLICT_RESOLUTION_ATTEMPTS
+
+    def test_ignores_staged_changes_without_commit(self):
+        gitwd = MagicMock()
+        # A rename staged by a previous pick and a conflict of the current one
+        gitwd.git.status.return_value = "R  b.txt\0a.txt\0DU c.txt\0"
+
+        assert _resolve_rebase_conflicts(gitwd, commit=False)
+        gitwd.git.rm.assert_called_once_with("--", "c.txt")
+        gitwd.git.commit.assert_not_called()
+
+    def test_retry_after_git_error(self):
+        gitwd = MagicMock()
+        gitwd.git.status.side_effect = [git.GitCommandError("status", 128), ""]
+
+        assert _resolve_rebase_conflicts(gitwd)
+        gitwd.git.cherry_pick.assert_called_once_with("--skip")
+
+
+class TestRebaseState:
+
+    @patch('rebasebot.bot.rev_parse')
+    def test_same_source_and_dest(self, mocked_rev_parse):
+        mocked_rev_parse.return_value = "abcdef123"
+        gitwd = MagicMock()
+        source = GitHubBranch("https://github.com/foo/source", "foo", "source", "main")
+        dest = GitHubBranch("https://github.com/foo/dest", "foo", "dest", "main")
+
+        rebase_state = _get_rebase_state(gitwd, source, dest)
+
+        assert rebase_state.merge_base == "abcdef123"
+        assert not _needs_rebase(gitwd, source, dest, rebase_state)
+        gitwd.git.merge_base.assert_not_called()
+
 
 class TestIsPrAvailable:
 
@@ -211,6 +333,24 @@ class TestReportResult:
             self.slack_webhook, slack_message)
 
 
+class TestMessageSlack:
+
+    @patch('rebasebot.bot._SLACK_SESSION')
+    def test_message_slack(self, mocked_session):
+        _message_slack("https://hooks.slack.com/services/...", "first")
+        _message_slack("https://hooks.slack.com/services/...", "second")
+
+        assert mocked_session.post.call_count == 2
+        mocked_session.post.assert_called_with(
+            "https://hooks.slack.com/services/...", json={"text": "second"}, timeout=5)
+
+    @patch('rebasebot.bot._SLACK_SESSION')
+    def test_no_webhook(self, mocked_session):
+        _message_slack(None, "message")
+
+        mocked_session.post.assert_not_called()
+
+
 class TestUpdatePrTitle:
     slack_webhook = "https://example.com/slack-webhook"
 
@@ -0,0 +1,78 @@
+#    Copyright 2026 Red Hat, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import os
+from unittest.mock import MagicMock, patch
+
+from rebasebot.merged_prs import get_merged_prs, load_merged_prs_cache, save_merged_prs_cache, lookup_merged_prs
+
+
+class TestGetMergedPrs:
+
+    def test_get_merged_prs(self):
+        source_repo = MagicMock()
+        source_repo.owner.login = "kubernetes"
+        source_repo.name = "kubernetes"
+        source_repo._post.return_value.json.return_value = {
+            "data": {
+                "repository": {
+                    "pr1": {"merged": True},
+                    "pr2": {"merged": False},
+                    "pr3": None,
+                }
+            }
+        }
+
+        assert get_merged_prs({1, 2, 3}, source_repo) == {1: True, 2: False}
+
+        source_repo._post.assert_called_once()
+        query = source_repo._post.call_args.kwargs["data"]["query"]
+        assert 'repository(owner: "kubernetes", name: "kubernetes")' in query
+        assert "pr1: pullRequest(number: 1) { merged }" in query
+
+    @patch('rebasebot.merged_prs.GRAPHQL_PR_BATCH_SIZE', 2)
+    def test_get_merged_prs_batches(self):
+        source_repo = MagicMock()
+        source_repo._post.return_value.json.return_value = {"data": {"repository": {}}}
+
+        assert get_merged_prs({1, 2, 3}, source_repo) == {}
+        assert source_repo._post.call_count == 2
+
+
+class TestMergedPrsCache:
+
+    def test_save_and_load(self, tmpdir):
+        path = os.path.join(tmpdir, "cache", "merged_prs.json")
+        assert load_merged_prs_cache(path) == {}
+
+        save_merged_prs_cache(path, {"org/repo#1": True})
+        assert load_merged_prs_cache(path) == {"org/repo#1": True}
+
+    def test_load_malformed(self, tmpdir):
+        path = os.path.join(tmpdir, "merged_prs.json")
+        with open(path, "w", encoding="utf8") as file:
+            file.write("not json")
+
+        assert load_merged_prs_cache(path) == {}
+
+    @patch('rebasebot.merged_prs.get_merged_prs')
+    def test_lookup_uses_cache(self, mocked_get_merged_prs):
+        source_repo = MagicMock(full_name="org/repo")
+        mocked_get_merged_prs.return_value = {2: True, 3: False}
+        cache = {"org/repo#1": True}
+
+        assert lookup_merged_prs({1, 2, 3}, source_repo, cache) == {1: True, 2: True, 3: False}
+
+        mocked_get_merged_prs.assert_called_once_with({2, 3}, source_repo)
+        # Only merged PRs are cached
+        assert cache == {"org/repo#1": True, "org/repo#2": True}
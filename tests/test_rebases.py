@@ -5,16 +5,21 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
+import github3
 from git import Repo
 
 from rebasebot.github import GitHubBranch
 from rebasebot.bot import (
+    _get_rebase_state,
+    _identify_downstream_commits,
     _init_working_dir,
+    _manual_rebase_pr_in_repo,
     _needs_rebase,
     _prepare_rebase_branch,
 
     run as rebasebot_run
 )
+from rebasebot.git_utils import rev_parse
 
 from .conftest import CommitBuilder
 
@@ -60,6 +65,99 @@ class TestBotInternalHelpers:
             i.name for i in os.scandir(working_repo_path)}
         assert working_repo_dir_content == {'test.go', '.git'}
 
+    def test_workdir_init_commit_graph(self, working_repo_context):
+        working_repo = working_repo_context.working_repo
+
+        with working_repo.config_reader() as config:
+            assert config.get_value("core", "commitGraph") is True
+        assert os.path.exists(os.path.join(
+            working_repo.git_dir, "objects", "info", "commit-graphs", "commit-graph-chain"))
+
+    def test_workdir_init_source_tag(self, init_test_repositories, fake_github_provider, tmpdir):
+        source, rebase, dest = init_test_repositories
+        source_repo = Repo(source.url)
+        source_repo.create_tag("v1.0.0")
+        # A tag that is not reachable from any source branch is not auto-followed
+        dangling_commit = source_repo.git.commit_tree("HEAD^{tree}", "-m", "dangling commit")
+        source_repo.create_tag("dangling", ref=dangling_commit)
+        source_tag = GitHubBranch(source.url, source.ns, source.name, "v1.0.0")
+
+        working_repo = _init_working_dir(
+            source_tag, dest, rebase, fake_github_provider, "foo", "foo@example.com", workdir=tmpdir
+        )
+
+        # Only the source tag is fetched
+        assert [tag.name for tag in working_repo.tags] == ["v1.0.0"]
+        assert working_repo.git.rev_parse("source/v1.0.0") == source_repo.head.commit.hexsha
+
+    @patch('rebasebot.git_utils.unshallow')
+    @patch('rebasebot.git_utils.DEEPEN_COMMITS', 1)
+    def test_shallow_fetch_deepen(self, mocked_unshallow, init_test_repositories, fake_github_provider, tmpdir):
+        source, rebase, dest = init_test_repositories
+        for i in range(2):
+            CommitBuilder(source).add_file(f"baz{i}.txt", "fiz").commit(f"other upstream commit #{i}")
+            CommitBuilder(dest).add_file(f"bar{i}.txt", "foo").commit(f"UPSTREAM: <carry>: carry patch #{i}")
+
+        working_repo = _init_working_dir(
+            source, dest, rebase, fake_github_provider, "foo", "foo@example.com",
+            workdir=tmpdir, fetch_depth=1
+        )
+        assert working_repo.git.rev_parse("--is-shallow-repository") == "true"
+
+        # The merge base is beyond the fetched depth, so the history is deepened until it is found
+        rebase_state = _get_rebase_state(working_repo, source, dest)
+        assert rebase_state.merge_base == Repo(source.url).commit("HEAD~2").hexsha
+        mocked_unshallow.assert_not_called()
+
+    @patch('rebasebot.git_utils.DEEPEN_COMMITS', 1)
+    def test_shallow_fetch_previous_rebase_merge(self, init_test_repositories, fake_github_provider, tmpdir):
+        source, rebase, dest = init_test_repositories
+        # A previous rebase merged a release branch that forked before the source branch commits
+        release = GitHubBranch(url=source.url, ns=source.ns, name=source.name, branch="release-1.0")
+        release_commits = [CommitBuilder(release).commit(f"release commit #{i}") for i in range(8)]
+        CommitBuilder(source).add_file("baz.txt", "fiz").commit("other upstream commit")
+
+        dest_repo = Repo(dest.url)
+        dest_repo.git.fetch(source.url, release.branch)
+        dest_repo.git.merge("--no-ff", "-m", "merge upstream/release-1.0 into main", release_commits[0].hexsha)
+        CommitBuilder(dest).add_file("bar.txt", "foo").commit("UPSTREAM: <carry>: carry patch")
+
+        working_repo = _init_working_dir(
+            source, dest, rebase, fake_github_provider, "foo", "foo@example.com",
+            workdir=tmpdir, fetch_depth=1
+        )
+        # All the source branches are fetched with the limited depth
+        assert working_repo.git.rev_list("--count", release.branch) == "1"
+
+        source_repo = MagicMock()
+        upstream_branches = [MagicMock(), MagicMock()]
+        upstream_branches[0].name, upstream_branches[1].name = source.branch, release.branch
+        source_repo.branches.return_value = upstream_branches
+
+        # The release branch is deepened to find the previous rebase merge
+        rebase_state = _get_rebase_state(working_repo, source, dest)
+        downstream_commits = _identify_downstream_commits(working_repo, source, dest, source_repo, rebase_state)
+        assert [commit_message for _, commit_message, _ in downstream_commits] == [
+            "UPSTREAM: <carry>: carry patch",
+        ]
+
+    def test_shallow_fetch_reused_workdir(self, working_repo_context, fake_github_provider):
+        r_ctx = working_repo_context
+        CommitBuilder(r_ctx.source).add_file("baz.txt", "fiz").commit("other upstream commit")
+
+        # The fetch depth doesn't apply to an existing working directory
+        working_repo = _init_working_dir(
+            r_ctx.source, r_ctx.dest, r_ctx.rebase, fake_github_provider, "foo", "foo@example.com",
+            workdir=r_ctx.working_repo_path, fetch_depth=1
+        )
+        assert working_repo.git.rev_parse("--is-shallow-repository") == "false"
+
+    def test_rev_parse(self, working_repo_context):
+        gitwd, source = working_repo_context.working_repo, working_repo_context.source
+        source_ref = f"source/{source.branch}"
+
+        assert rev_parse(gitwd, source_ref) == gitwd.git.rev_parse(source_ref)
+
     def test_needs_rebase(self, working_repo_context):
         r_ctx = working_repo_context
         gitwd, source, dest = r_ctx.working_repo, r_ctx.source, r_ctx.dest
@@ -184,6 +282,99 @@ class TestRebases:
 * '<source_author>, Upstream commit'
 """.strip()  # noqa: W291
 
+    def test_squash_bot_conflict_dry_run(self, init_test_repositories, fake_github_provider, tmpdir):
+        source, rebase, dest = init_test_repositories
+        CommitBuilder(source).update_file(
+            "test.go", "new content").commit("update test.go")
+        with CommitBuilder(dest) as cb:
+            cb.remove_file("test.go")
+            cb.commit("commit #1 from genbot",
+                      committer_email="genbot@example.com")
+        with CommitBuilder(dest) as cb:
+            cb.add_file("generated-test", "content")
+            cb.commit("commit #2 from genbot",
+                      committer_email="genbot@example.com")
+
+        result = rebasebot_run(
+            source=source,
+            dest=dest,
+            rebase=rebase,
+            working_dir=tmpdir,
+            git_username="test_rebasebot",
+            git_email="test@rebasebot.ocp",
+            github_app_provider=fake_github_provider,
+            slack_webhook=None,
+            tag_policy="soft",
+            bot_emails=["genbot@example.com"],
+            exclude_commits=[],
+            update_go_modules=False,
+            dry_run=True,
+        )
+        assert (result)
+
+        working_repo = Repo.init(tmpdir)
+        assert working_repo.head.ref.name == "rebase"
+        log_graph = working_repo.git.log(
+            "--graph", "--oneline", "--pretty='<%an>, %s'")
+
+        assert log_graph == r"""
+* '<dest_genbot@example.com>, commit #2 from genbot'
+* '<dest_author>, UPSTREAM: <carry>: our cool addition'
+*   '<test_rebasebot>, merge upstream/main into main'
+|\  
+| * '<source_author>, update test.go'
+* | '<dest_genbot@example.com>, commit #2 from genbot'
+* | '<dest_genbot@example.com>, commit #1 from genbot'
+* | '<dest_author>, UPSTREAM: <carry>: our cool addition'
+|/  
+* '<source_author>, Upstream commit'
+""".strip()  # noqa: W291
+
+        # The squashed commit contains changes from both bot commits
+        assert working_repo.git.show("--name-status", "--format=", "HEAD").splitlines() == [
+            "A\tgenerated-test",
+            "D\ttest.go",
+        ]
+
+    def test_squash_bot_conflict_after_rename_dry_run(self, init_test_repositories, fake_github_provider, tmpdir):
+        source, rebase, dest = init_test_repositories
+        CommitBuilder(source).update_file(
+            "test.go", "new content").commit("update test.go")
+        with CommitBuilder(dest) as cb:
+            cb.move_file("another_file.go", "moved_file.go")
+            cb.commit("commit #1 from genbot",
+                      committer_email="genbot@example.com")
+        with CommitBuilder(dest) as cb:
+            cb.remove_file("test.go")
+            cb.commit("commit #2 from genbot",
+                      committer_email="genbot@example.com")
+
+        result = rebasebot_run(
+            source=source,
+            dest=dest,
+            rebase=rebase,
+            working_dir=tmpdir,
+            git_username="test_rebasebot",
+            git_email="test@rebasebot.ocp",
+            github_app_provider=fake_github_provider,
+            slack_webhook=None,
+            tag_policy="soft",
+            bot_emails=["genbot@example.com"],
+            exclude_commits=[],
+            update_go_modules=False,
+            dry_run=True,
+        )
+        assert (result)
+
+        # The rename staged by the first bot commit doesn't prevent
+        # resolving the conflict of the second one
+        working_repo = Repo.init(tmpdir)
+        assert working_repo.head.commit.message.strip() == "commit #2 from genbot"
+        assert working_repo.git.show("--name-status", "--format=", "HEAD").splitlines() == [
+            "R100\tanother_file.go\tmoved_file.go",
+            "D\ttest.go",
+        ]
+
     def test_first_run_dest_has_merges_dry_run(self, init_test_repositories, fake_github_provider, tmpdir):
         source, rebase, dest = init_test_repositories
         with CommitBuilder(source) as cb:
@@ -307,6 +498,35 @@ class TestRebases:
 * '<source_author>, Upstream commit'
 """.strip()  # noqa: W291
 
+    def test_conflict_special_characters_filename(self, init_test_repositories, fake_github_provider, tmpdir):
+        source, rebase, dest = init_test_repositories
+        filename = "ünïcödé file.txt"
+        CommitBuilder(source).add_file(filename, "content").commit("add file")
+        Repo(dest.url).git.pull("--no-rebase", "--no-edit", source.url, source.branch)
+        CommitBuilder(source).update_file(filename, "new content").commit("update file")
+        CommitBuilder(dest).remove_file(filename).commit("remove file")
+
+        result = rebasebot_run(
+            source=source,
+            dest=dest,
+            rebase=rebase,
+            working_dir=tmpdir,
+            git_username="test_rebasebot",
+            git_email="test@rebasebot.ocp",
+            github_app_provider=fake_github_provider,
+            slack_webhook=None,
+            tag_policy="soft",
+            bot_emails=[],
+            exclude_commits=[],
+            update_go_modules=False,
+            dry_run=True,
+        )
+        assert (result)
+
+        working_repo = Repo.init(tmpdir)
+        assert working_repo.head.commit.summary == "remove file"
+        assert not os.path.exists(os.path.join(tmpdir, filename))
+
     @patch("rebasebot.bot._message_slack")
     def test_has_manual_rebase_pr(self, mocked_message_slack, init_test_repositories, fake_github_provider, tmpdir):
         source, rebase, _ = init_test_repositories
@@ -314,8 +534,9 @@ class TestRebases:
         pr = MagicMock()
         pr.labels = [{'name': 'rebase/manual'}]
         pr.html_url = "https://github.com/rg/test/pull/1"
-        dest.pull_requests.return_value = [pr]
+        dest.pull_request.return_value = pr
         fake_github_provider.github_app.repository.return_value = dest
+        fake_github_provider.github_app.search_issues.return_value = [MagicMock()]
 
         result = rebasebot_run(
             source=source,
@@ -337,6 +558,23 @@ class TestRebases:
             None, f"Repo {dest.clone_url} has PR {pr.html_url} with 'rebase/manual' label, aborting")
         assert (result)
 
+    def test_manual_rebase_pr_search_rate_limited(self):
+        gh_app = MagicMock()
+        response = MagicMock(status_code=403)
+        response.json.return_value = {"message": "API rate limit exceeded"}
+        gh_app.search_issues.side_effect = github3.exceptions.ForbiddenError(response)
+
+        repo = MagicMock()
+        pr = MagicMock()
+        pr.labels = [{'name': 'rebase/manual'}]
+        repo.pull_requests.return_value = [MagicMock(labels=[]), pr]
+
+        # Falls back to listing all pull requests
+        assert _manual_rebase_pr_in_repo(gh_app, repo) == pr
+
+        repo.pull_requests.return_value = [MagicMock(labels=[])]
+        assert _manual_rebase_pr_in_repo(gh_app, repo) is None
+
     def test_strict_and_excluded_commits(self, init_test_repositories, fake_github_provider, tmpdir):
         source, rebase, dest = init_test_repositories
         with CommitBuilder(source) as cb: